@@ -0,0 +1,169 @@
+"""Deterministic synthetic order exports with the same 20-column schema as `dataset`.
+
+Usage: python benchmarks/generate.py 100k [--seed 7] [--output PATH]
+
+Rows are generated and written in fixed-size blocks, each from its own seeded RNG,
+so a given (rows, seed) pair always produces byte-identical files and memory stays
+flat even at 10M rows. Customers place several orders each and restaurants/dishes
+follow a Zipf-like popularity curve, so group-by cardinalities grow with the row
+count the way a real export would.
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = Path(__file__).parent / "data"
+DEFAULT_SEED = 7
+BLOCK_ROWS = 1_000_000
+
+COLUMNS = [
+    'customer_id', 'gender', 'age', 'city', 'signup_date', 'order_id', 'order_date',
+    'restaurant_name', 'dish_name', 'category', 'quantity', 'price', 'payment_method',
+    'order_frequency', 'last_order_date', 'loyalty_points', 'churned', 'rating',
+    'rating_date', 'delivery_status',
+]
+
+# Values seen in the real export; larger datasets extend them with synthetic names
+GENDERS = ['Female', 'Male', 'Other']
+AGE_GROUPS = ['Teenager', 'Adult', 'Senior']
+CITIES = ['Multan', 'Lahore', 'Peshawar', 'Islamabad', 'Karachi']
+RESTAURANTS = ['Subway', 'KFC', 'Pizza Hut', 'Burger King', "McDonald's"]
+DISHES = ['Pasta', 'Sandwich', 'Pizza', 'Fries', 'Burger']
+CATEGORIES = ['Italian', 'Fast Food', 'Continental', 'Chinese', 'Dessert']
+PAYMENT_METHODS = ['Cash', 'Card', 'Wallet']
+CHURN_STATUSES = ['Active', 'Inactive']
+DELIVERY_STATUSES = ['Delivered', 'Delayed', 'Cancelled']
+
+# Date windows (inclusive start, length in days) matching the real export
+SIGNUP_WINDOW = ('2023-08-22', 731)
+ORDER_WINDOW = ('2023-08-23', 731)
+RECENT_WINDOW = ('2024-08-21', 366)  # last_order_date and rating_date
+
+ORDERS_PER_CUSTOMER = 3
+
+
+def parse_rows(text):
+    """'10k' -> 10_000, '1m' -> 1_000_000; plain integers pass through."""
+    text = str(text).strip().lower()
+    scale = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * scale)
+
+
+def default_path(rows, seed=DEFAULT_SEED):
+    return DATA_DIR / f"orders-{rows}-s{seed}.csv"
+
+
+def _extend(base, count, prefix):
+    """`base` padded with synthetic names up to `count` values."""
+    return base + [f"{prefix} {i}" for i in range(len(base) + 1, count + 1)]
+
+
+def _zipf_weights(count, exponent=1.1):
+    weights = 1.0 / np.arange(1, count + 1) ** exponent
+    return weights / weights.sum()
+
+
+def _date_labels(window):
+    """Unpadded M/D/YYYY labels for every day in the window, as the export writes them."""
+    days = pd.date_range(window[0], periods=window[1], freq='D')
+    return [f"{d.month}/{d.day}/{d.year}" for d in days]
+
+
+def _labels(codes, values):
+    return pd.Categorical.from_codes(codes, categories=pd.Index(values, dtype=object))
+
+
+def _ids(prefix, numbers):
+    return prefix + pd.Series(numbers).astype(str)
+
+
+def dimensions(rows):
+    """Category values for a dataset of `rows` rows; grows slowly with the row count."""
+    return {
+        'city': _extend(CITIES, int(np.clip(rows // 200_000, 5, 40)), 'City'),
+        'restaurant_name': _extend(RESTAURANTS, int(np.clip(rows // 2_000, 5, 5_000)), 'Restaurant'),
+        'dish_name': _extend(DISHES, int(np.clip(rows // 10_000, 5, 1_000)), 'Dish'),
+    }
+
+
+def customer_table(n_customers, dims, seed):
+    """Per-customer attributes, repeated on every order the customer places."""
+    rng = np.random.default_rng([seed, 0])
+    return {
+        'gender': rng.integers(0, len(GENDERS), n_customers),
+        'age': rng.integers(0, len(AGE_GROUPS), n_customers),
+        'city': rng.integers(0, len(dims['city']), n_customers),
+        'signup_date': rng.integers(0, SIGNUP_WINDOW[1], n_customers),
+        'order_frequency': rng.integers(1, 51, n_customers),
+        'last_order_date': rng.integers(0, RECENT_WINDOW[1], n_customers),
+        'loyalty_points': rng.integers(0, 501, n_customers),
+        'churned': rng.integers(0, len(CHURN_STATUSES), n_customers),
+    }
+
+
+def order_block(start, count, n_customers, customers, dims, seed):
+    """Orders `start`..`start + count - 1` as a frame in export column order."""
+    rng = np.random.default_rng([seed, 1 + start // BLOCK_ROWS])
+    cust = rng.integers(0, n_customers, count)
+    restaurants = rng.choice(len(dims['restaurant_name']), count, p=_zipf_weights(len(dims['restaurant_name'])))
+    dishes = rng.choice(len(dims['dish_name']), count, p=_zipf_weights(len(dims['dish_name'])))
+    signup_labels, order_labels, recent_labels = (
+        _date_labels(SIGNUP_WINDOW), _date_labels(ORDER_WINDOW), _date_labels(RECENT_WINDOW)
+    )
+
+    frame = pd.DataFrame({
+        'customer_id': _ids('C', cust + 1),
+        'gender': _labels(customers['gender'][cust], GENDERS),
+        'age': _labels(customers['age'][cust], AGE_GROUPS),
+        'city': _labels(customers['city'][cust], dims['city']),
+        'signup_date': _labels(customers['signup_date'][cust], signup_labels),
+        'order_id': _ids('O', np.arange(start + 1, start + count + 1)),
+        'order_date': _labels(rng.integers(0, ORDER_WINDOW[1], count), order_labels),
+        'restaurant_name': _labels(restaurants, dims['restaurant_name']),
+        'dish_name': _labels(dishes, dims['dish_name']),
+        'category': _labels(dishes % len(CATEGORIES), CATEGORIES),
+        'quantity': rng.integers(1, 6, count),
+        'price': np.round(rng.uniform(100.0, 1500.0, count), 2),
+        'payment_method': _labels(rng.integers(0, len(PAYMENT_METHODS), count), PAYMENT_METHODS),
+        'order_frequency': customers['order_frequency'][cust],
+        'last_order_date': _labels(customers['last_order_date'][cust], recent_labels),
+        'loyalty_points': customers['loyalty_points'][cust],
+        'churned': _labels(customers['churned'][cust], CHURN_STATUSES),
+        'rating': rng.integers(1, 6, count),
+        'rating_date': _labels(rng.integers(0, RECENT_WINDOW[1], count), recent_labels),
+        'delivery_status': _labels(rng.integers(0, len(DELIVERY_STATUSES), count), DELIVERY_STATUSES),
+    })
+    return frame[COLUMNS]
+
+
+def generate(rows, path=None, seed=DEFAULT_SEED, overwrite=False):
+    """Writes a `rows`-row export to `path` (reused if it already exists) and returns the path."""
+    path = Path(path) if path else default_path(rows, seed)
+    if path.exists() and not overwrite:
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    dims = dimensions(rows)
+    n_customers = max(1, rows // ORDERS_PER_CUSTOMER)
+    customers = customer_table(n_customers, dims, seed)
+
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", newline="") as fh:
+        for start in range(0, rows, BLOCK_ROWS):
+            block = order_block(start, min(BLOCK_ROWS, rows - start), n_customers, customers, dims, seed)
+            # The real export uses CRLF line endings
+            block.to_csv(fh, index=False, header=start == 0, lineterminator="\r\n")
+    tmp.replace(path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("rows", help="row count, e.g. 10k, 100k, 1m, 10m")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", help="file to write (default: benchmarks/data/orders-<rows>-s<seed>.csv)")
+    parser.add_argument("--overwrite", action="store_true", help="regenerate even if the file exists")
+    args = parser.parse_args()
+    print(generate(parse_rows(args.rows), args.output, args.seed, args.overwrite))
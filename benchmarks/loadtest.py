@@ -0,0 +1,278 @@
+"""Concurrent-session load test: simulated analysts sharing one app server process.
+
+Usage: python benchmarks/loadtest.py [--sessions 1,4,16] [--sizes 10k,100k] [--rounds 1]
+
+Every (dataset size, session count) pair starts a fresh `streamlit run` server, standing
+in for one Streamlit server pod, and drives that many sessions against it at once. Each
+session is a websocket client speaking the browser's protocol (BackMsg rerun requests,
+ForwardMsg deltas until script_finished), so every script run happens on the server's
+own session threads and shares its cache_resource and data store, exactly as real users
+would. A session opens the login page, logs in, switches through every tab and logs out,
+`--rounds` times; each rerun is timed from request to script_finished. One warm-up
+session runs first so the numbers describe a pod with its caches filled (--cold skips it).
+
+Reported per pair: p50/p95/p99 rerun latency (overall and per step), reruns per second
+across all sessions, failed reruns (script exceptions or a missing widget), and the
+server's peak and final RSS. Results are written as JSON to benchmarks/results/, like
+run.py.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).parent
+sys.path.insert(0, str(BENCH_DIR))
+
+from generate import DATA_DIR, DEFAULT_SEED, generate, parse_rows  # noqa: E402
+from run import REPO_DIR, RESULTS_DIR, _commit  # noqa: E402
+
+APP_FILE = REPO_DIR / "app.py"
+DEFAULT_SESSIONS = "1,4,16"
+DEFAULT_SIZES = "10k,100k"
+PERCENTILES = (50, 95, 99)
+RUN_TIMEOUT = 600  # Seconds one script run may take (a cold run parses the whole dataset)
+START_TIMEOUT = 60  # Seconds the server may take to answer its health check
+
+
+def _latency_stats(seconds):
+    values = np.asarray(seconds) * 1000
+    stats = {f'p{p}_ms': float(np.percentile(values, p)) for p in PERCENTILES}
+    stats.update({'runs': len(values), 'mean_ms': float(values.mean()), 'max_ms': float(values.max())})
+    return stats
+
+
+def _server_rss_mb(pid):
+    """(peak, current) resident set size of the server process in MB (Linux only; Nones elsewhere)."""
+    sizes = {}
+    try:
+        with open(f"/proc/{pid}/status") as fh:
+            for line in fh:
+                key = line.split(":")[0]
+                if key in ("VmHWM", "VmRSS"):
+                    sizes[key] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return sizes.get("VmHWM"), sizes.get("VmRSS")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(path, rows):
+    """Starts `streamlit run app.py` on a free port against the export at `path`; returns (process, port)."""
+    port = _free_port()
+    env = dict(
+        os.environ,
+        FOODPANDA_DATA_FILE=str(path),
+        # Snapshots of the synthetic exports stay next to them, away from the real dataset's
+        FOODPANDA_SNAPSHOT_DIR=str(DATA_DIR / f".snapshot-{rows}"),
+    )
+    command = [
+        sys.executable, "-m", "streamlit", "run", str(APP_FILE),
+        "--server.headless", "true", "--server.port", str(port),
+        "--browser.gatherUsageStats", "false",
+    ]
+    server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"streamlit server exited with code {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return server, port
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"streamlit server did not answer on port {port} within {START_TIMEOUT}s")
+
+
+class Session:
+    """One browser tab's websocket connection: sends reruns and collects the rendered widget ids."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.page_hash = ""
+        self.widgets = {}  # widget key (or "kind:label" for unkeyed widgets) -> widget id
+        self.exceptions = []
+
+    async def rerun(self, **states):
+        """Reruns the script with the given widget states (key -> WidgetState fields); returns seconds."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        message = BackMsg()
+        message.rerun_script.query_string = ""
+        message.rerun_script.page_script_hash = self.page_hash
+        for key, fields in states.items():
+            message.rerun_script.widget_states.widgets.add(id=self.widgets[key], **fields)
+
+        widgets, exceptions = {}, []
+        start = time.perf_counter()
+        await self.connection.send(message.SerializeToString())
+        while True:
+            reply = ForwardMsg()
+            reply.ParseFromString(await asyncio.wait_for(self.connection.recv(), RUN_TIMEOUT))
+            kind = reply.WhichOneof("type")
+            if kind == "new_session":
+                self.page_hash = reply.new_session.main_script_hash
+            elif kind == "delta" and reply.delta.WhichOneof("type") == "new_element":
+                self._collect(reply.delta.new_element, widgets, exceptions)
+            elif kind == "script_finished":
+                seconds = time.perf_counter() - start
+                self.widgets, self.exceptions = widgets, exceptions
+                return seconds
+
+    @staticmethod
+    def _collect(element, widgets, exceptions):
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            exceptions.append(element.exception.message)
+            return
+        widget_id = getattr(getattr(element, kind), "id", "")
+        if widget_id:
+            # Keyed widget ids end in their user key: "$$ID-<hash>-<key>"
+            key = widget_id.split("-", 2)[2] if widget_id.startswith("$$ID-") else widget_id
+            if key == "None":
+                key = f"{kind}:{getattr(element, kind).label}"
+            widgets[key] = widget_id
+
+
+async def session(port, username, password, tabs, rounds):
+    """One analyst's script runs as (step, seconds, failed) tuples."""
+    import websockets
+
+    timings = []
+
+    async def timed(step, **states):
+        try:
+            seconds = await client.rerun(**states)
+            timings.append((step, seconds, bool(client.exceptions)))
+        except KeyError:
+            # The widget to interact with was not rendered by the previous run: no rerun to time
+            timings.append((step, None, True))
+
+    async with websockets.connect(
+        f"ws://127.0.0.1:{port}/_stcore/stream", subprotocols=["streamlit"], max_size=None,
+    ) as connection:
+        client = Session(connection)
+        for _ in range(rounds):
+            await timed('login_page')
+            await timed('login', login_user={'string_value': username}, login_pass={'string_value': password},
+                        **{'button:Login': {'trigger_value': True}})
+            for tab in tabs:
+                await timed(f'tab:{tab}', **{f'nav_{tab}': {'trigger_value': True}})
+            await timed('logout', logout_btn={'trigger_value': True})
+    return timings
+
+
+async def drive(port, sessions, rounds, cold):
+    """Runs `sessions` concurrent sessions against the server and returns their measurements."""
+    import app
+
+    users = [(name, password) for name, password in app.USERS.items() if name != app.PROFILE_ADMIN]
+    tabs = app.TAB_NAMES
+
+    if not cold:
+        await session(port, *users[0], tabs, 1)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        session(port, *users[i % len(users)], tabs, rounds) for i in range(sessions)
+    ))
+    wall = time.perf_counter() - start
+    timings = [t for result in results for t in result]
+
+    by_step = {}
+    for step, seconds, _ in timings:
+        if seconds is not None:
+            by_step.setdefault(step, []).append(seconds)
+    return {
+        'sessions': sessions,
+        'wall_seconds': wall,
+        'reruns_per_second': len(timings) / wall,
+        'failed_runs': sum(failed for _, _, failed in timings),
+        'latency': _latency_stats([seconds for _, seconds, _ in timings if seconds is not None]),
+        'steps': {step: _latency_stats(values) for step, values in sorted(by_step.items())},
+    }
+
+
+def run_pair(path, rows, sessions, rounds, cold):
+    """Measures one (size, sessions) pair on a fresh server process."""
+    server, port = start_server(path, rows)
+    try:
+        result = asyncio.run(drive(port, sessions, rounds, cold))
+        result['peak_rss_mb'], result['rss_mb'] = _server_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", default=DEFAULT_SESSIONS, help=f"comma-separated concurrent session counts (default {DEFAULT_SESSIONS})")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma-separated row counts (default {DEFAULT_SIZES})")
+    parser.add_argument("--rounds", type=int, default=1, help="login/tabs/logout cycles per session")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--cold", action="store_true", help="skip the warm-up session")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/loadtest-<timestamp>-<commit>.json)")
+    args = parser.parse_args()
+
+    # The app is imported only for its users and tabs; its bare-mode warnings are noise here
+    import logging
+    logging.disable(logging.WARNING)
+    sys.path.insert(0, str(REPO_DIR))
+
+    results = []
+    print(f"{'rows':>11} {'sessions':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'runs/s':>7} {'failed':>6} {'peak RSS':>9}")
+    for rows in [parse_rows(s) for s in args.sizes.split(",")]:
+        path = generate(rows, seed=args.seed)
+        for sessions in [int(s) for s in args.sessions.split(",")]:
+            result = run_pair(path, rows, sessions, args.rounds, args.cold)
+            result['rows'] = rows
+            results.append(result)
+            latency = result['latency']
+            print(f"{rows:>11,} {sessions:>8} {latency['p50_ms']:>6.0f}ms {latency['p95_ms']:>6.0f}ms "
+                  f"{latency['p99_ms']:>6.0f}ms {result['reruns_per_second']:>7.1f} {result['failed_runs']:>6} "
+                  f"{result['peak_rss_mb'] or 0:>6.0f} MB", flush=True)
+
+    now = datetime.now(timezone.utc)
+    commit = _commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': now.isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'rounds': args.rounds,
+            'cold': args.cold,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"loadtest-{now:%Y%m%dT%H%M%S}-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nwrote {output}")
+
+
+if __name__ == "__main__":
+    main()
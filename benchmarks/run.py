@@ -0,0 +1,218 @@
+"""Headless benchmark of every dashboard stage over synthetic exports of growing size.
+
+Usage: python benchmarks/run.py [--sizes 10k,100k,1m] [--repeat 3] [--baseline OLD.json]
+
+For each size the suite times parse (CSV -> frame), clean (clean_orders), aggregate
+(cube + customer summary), the three tab aggregations and the three tab renders (chart
+spec build, run against Streamlit's bare-mode no-op backend), plus the out-of-core
+streaming path. Every stage is timed `--repeat` times and then run once more under
+tracemalloc for its peak allocation. Results are written as JSON to
+benchmarks/results/, named after the current commit, so runs can be diffed with
+--baseline.
+"""
+import argparse
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = Path(__file__).parent
+REPO_DIR = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+# The app is imported and rendered without a Streamlit server; its bare-mode warnings are noise here
+logging.disable(logging.WARNING)
+
+import app  # noqa: E402
+from generate import DEFAULT_SEED, generate, parse_rows  # noqa: E402
+
+DEFAULT_SIZES = "10k,100k,1m"
+STAGES = [
+    'parse', 'clean', 'aggregate',
+    'sales_aggregates', 'customer_aggregates', 'product_aggregates',
+    'sales_render', 'customer_render', 'product_render',
+    'stream',
+]
+REGRESSION_RATIO = 1.10  # Flag stages more than 10% slower than the baseline...
+REGRESSION_MIN_SECONDS = 0.005  # ...and at least this much slower, so timer noise isn't flagged
+
+
+def _rss_mb():
+    """Peak resident set size of this process so far, in MB (None where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 1024 ** (2 if sys.platform == "darwin" else 1)
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def measure(fn, repeat):
+    """Runs `fn` `repeat` times for timing plus once under tracemalloc; returns (stats, result)."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'seconds_min': min(timings),
+        'seconds_median': statistics.median(timings),
+        'peak_alloc_mb': peak / 1024 ** 2,
+    }, result
+
+
+def stage_functions(path):
+    """Stage name -> callable; each stage consumes the previous stages' outputs."""
+    out = {}
+
+    def parse():
+        out['raw'] = pd.read_csv(path, dtype=app.CSV_DTYPES)
+        return out['raw']
+
+    def clean():
+        # clean_orders works in place, so every run starts from a fresh copy of the parse
+        out['df'] = app.clean_orders(out['raw'].copy())
+        return out['df']
+
+    def aggregate():
+        out['aggregates'] = app.build_aggregates(out['df'])
+        return out['aggregates']
+
+    def tab_aggregates(name):
+        def compute():
+            cube, customers = out['aggregates']['cube'], out['aggregates']['customers']
+            customer_months = out['aggregates']['customer_months']
+            out[name] = {
+                'sales': lambda: app.sales_overview_aggregates(cube),
+                'customer': lambda: app.customer_overview_aggregates(customers, cube, customer_months=customer_months),
+                'product': lambda: app.product_overview_aggregates(cube),
+            }[name]()
+            return out[name]
+        return compute
+
+    def tab_render(name):
+        show = {
+            'sales': app.show_sales_overview,
+            'customer': app.show_customer_overview,
+            'product': app.show_product_overview,
+        }[name]
+        return lambda: show(out[name])
+
+    def stream():
+        return app.stream_kpis(path)
+
+    functions = {'parse': parse, 'clean': clean, 'aggregate': aggregate, 'stream': stream}
+    for name in ('sales', 'customer', 'product'):
+        functions[f'{name}_aggregates'] = tab_aggregates(name)
+        functions[f'{name}_render'] = tab_render(name)
+    return functions
+
+
+def run(sizes, stages, repeat, seed):
+    results = []
+    for rows in sizes:
+        path = generate(rows, seed=seed)
+        functions = stage_functions(path)
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            stats, _ = measure(functions[stage], repeat)
+            stats.update({'rows': rows, 'stage': stage, 'rss_mb': _rss_mb()})
+            results.append(stats)
+            print(f"{rows:>11,} {stage:<20} {stats['seconds_median']:9.4f}s  "
+                  f"peak {stats['peak_alloc_mb']:9.1f} MB", flush=True)
+    return results
+
+
+def compare(results, baseline_path):
+    """Prints the median-time ratio of each stage against a previous results file."""
+    baseline = json.loads(Path(baseline_path).read_text())
+    previous = {(r['rows'], r['stage']): r for r in baseline['results']}
+    print(f"\nvs {baseline_path} ({baseline['meta']['commit']})")
+    regressions = 0
+    for r in results:
+        old = previous.get((r['rows'], r['stage']))
+        if old is None:
+            continue
+        ratio = r['seconds_median'] / max(old['seconds_median'], 1e-9)
+        slower = r['seconds_median'] - old['seconds_median']
+        flag = "  REGRESSION" if ratio > REGRESSION_RATIO and slower > REGRESSION_MIN_SECONDS else ""
+        regressions += bool(flag)
+        print(f"{r['rows']:>11,} {r['stage']:<20} x{ratio:6.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"comma-separated row counts (default {DEFAULT_SIZES}; add 10m for the large run)")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma-separated subset of: " + ", ".join(STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument("--baseline", help="previous results file to compare against")
+    args = parser.parse_args()
+
+    sizes = [parse_rows(s) for s in args.sizes.split(",")]
+    stages = set(args.stages.split(","))
+    unknown = stages - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    results = run(sizes, stages, args.repeat, args.seed)
+
+    now = datetime.now(timezone.utc)
+    commit = _commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': now.isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{now:%Y%m%dT%H%M%S}-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nwrote {output}")
+
+    if args.baseline and compare(results, args.baseline):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""Process-pool tasks of the parallel ingest (see Parallel Partitioned Ingestion in app.py).
+
+The pool never forks the multithreaded Streamlit server: workers are started with the
+forkserver (or spawn) method, so each task must be importable by name. The tasks live
+here and reach the ingest code through `import app` inside the worker, which never
+re-runs the dashboard script of the server process.
+"""
+
+
+def parse_range(task):
+    """Parses and cleans one newline-aligned byte range of the source file."""
+    import app
+    path, header, lo, hi = task
+    return app._parse_rows(path, header, lo, hi)
+
+
+def build_cube(frame):
+    import app
+    return app.build_cube(frame)
+
+
+def build_customer_summary(frame):
+    import app
+    return app.build_customer_summary(frame)
+
+
+def build_customer_months(frame):
+    import app
+    return app.build_customer_months(frame)
@@ -0,0 +1,31 @@
+"""Splits a single order export into the monthly shards of a partitioned dataset directory.
+
+Usage: python partition.py [SOURCE] [DATASET_DIR]
+
+SOURCE defaults to the app's export (FOODPANDA_DATA_FILE, else `dataset`), DATASET_DIR to
+FOODPANDA_DATASET_DIR, else `dataset.d`. Shards and manifest are written by the app's own
+write_partitions(); point FOODPANDA_DATASET_DIR at the directory to serve them.
+"""
+import argparse
+import logging
+from pathlib import Path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", nargs="?", help="export to split (default: the app's data file)")
+    parser.add_argument("dataset_dir", nargs="?", help="directory to write (default: FOODPANDA_DATASET_DIR or dataset.d)")
+    args = parser.parse_args()
+
+    # The app is imported only for write_partitions; its bare-mode warnings are noise here
+    logging.disable(logging.WARNING)
+    import app
+
+    source = Path(args.source) if args.source else app.DATA_FILE
+    target = Path(args.dataset_dir) if args.dataset_dir else app.DATASET_DIR or Path("dataset.d")
+    manifest = app.write_partitions(source, target)
+    print(f"{len(manifest['partitions'])} partitions written to {target}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Shared fixtures: the app module (imported bare, without a Streamlit server) and sample exports."""
+import logging
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_DIR = Path(__file__).parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+# The app is imported without a Streamlit server; its bare-mode warnings are noise here
+logging.disable(logging.WARNING)
+
+import app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def export_lines():
+    """Header and data lines of the bundled export."""
+    lines = (REPO_DIR / "dataset").read_text().splitlines()
+    return lines[0], lines[1:]
+
+
+@pytest.fixture(scope="session")
+def orders():
+    """The bundled export, cleaned."""
+    return app._full_ingest(REPO_DIR / "dataset")["frame"]
+
+
+def write_export(path, header, rows):
+    """Writes an export with the given data lines and returns its path."""
+    path.write_text("\n".join([header, *rows]) + "\n")
+    return path
+
+
+AGGREGATE_KEYS = {
+    "cube": app.CUBE_DIMENSIONS,
+    "customers": ["customer_id"],
+    "customer_months": ["customer_id", "month"],
+}
+
+
+def _by_key(frame, keys):
+    """Aggregate rows in key order, keys compared as text (categorical unions may order them differently)."""
+    text = frame.assign(**{key: frame[key].astype(str) for key in keys})
+    return text.sort_values(keys, ignore_index=True)
+
+
+def assert_same_aggregates(expected, actual, exact=True):
+    """Every derived aggregate of two ingest states holds the same data.
+
+    `exact=False` allows float rounding from merged sums, categorical categories in a
+    different order and aggregate rows in a different order.
+    """
+    import pandas as pd
+    for key in app.DERIVED_AGGREGATES:
+        left, right = expected[key], actual[key]
+        if not exact:
+            left, right = _by_key(left, AGGREGATE_KEYS[key]), _by_key(right, AGGREGATE_KEYS[key])
+        pd.testing.assert_frame_equal(left, right, check_exact=exact, check_categorical=exact)
+
+
+def assert_same_ingest(expected, actual, exact=True):
+    """The frame and every derived aggregate of two ingest states hold the same data (see assert_same_aggregates)."""
+    import pandas as pd
+    pd.testing.assert_frame_equal(expected["frame"], actual["frame"], check_exact=exact, check_categorical=exact)
+    assert_same_aggregates(expected, actual, exact)
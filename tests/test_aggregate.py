@@ -0,0 +1,50 @@
+"""aggregate_by_key against pandas' groupby on the narrow dtypes clean_orders produces."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import app
+
+
+@pytest.fixture
+def narrow_frame():
+    rng = np.random.default_rng(3)
+    n = 20_000
+    return pd.DataFrame({
+        # One unobserved category, which both sides must drop
+        'key': pd.Categorical(rng.choice(['a', 'b', 'c'], n), categories=['a', 'b', 'c', 'unused']),
+        'text_key': rng.choice(['x', 'y'], n),
+        'quantity': np.full(n, 5, dtype=np.int16),
+        'small': rng.integers(-128, 128, n).astype(np.int8),
+        'points': rng.integers(0, 2 ** 31 - 1, n).astype(np.int32),
+        'label': rng.choice(['p', 'q', 'r'], n),
+    })
+
+
+OUTPUTS = {
+    'quantity_sum': ('quantity', 'sum'),
+    'small_sum': ('small', 'sum'),
+    'points_sum': ('points', 'sum'),
+    'small_min': ('small', 'min'),
+    'small_max': ('small', 'max'),
+    'points_max': ('points', 'max'),
+    'labels': ('label', 'nunique'),
+    'rows': ('quantity', 'size'),
+}
+
+
+@pytest.mark.parametrize("key", ['key', 'text_key'])
+def test_aggregate_by_key_matches_groupby(narrow_frame, key):
+    expected = narrow_frame.groupby(key, observed=True).agg(**OUTPUTS).reset_index()
+    actual = app.aggregate_by_key(narrow_frame, key, **OUTPUTS)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    for name, (col, how) in OUTPUTS.items():
+        if how == 'sum':
+            assert actual[name].dtype == np.int64
+        elif how in ('min', 'max'):
+            assert actual[name].dtype == narrow_frame[col].dtype
+
+
+def test_integer_sum_does_not_wrap():
+    frame = pd.DataFrame({'key': np.zeros(20_000, dtype=np.int64), 'quantity': np.full(20_000, 5, dtype=np.int16)})
+    assert app.aggregate_by_key(frame, 'key', total=('quantity', 'sum'))['total'].tolist() == [100_000]
@@ -0,0 +1,86 @@
+"""Prefix-sum KPI windows and deltas against pandas sums over the cube."""
+import pandas as pd
+import pytest
+
+from conftest import app
+
+
+@pytest.fixture(scope="module")
+def cube(orders):
+    return app.build_cube(orders)
+
+
+@pytest.fixture(scope="module")
+def customers(orders):
+    return app.build_customer_summary(orders)
+
+
+def pandas_total(cube, metric, start, end):
+    return cube.loc[cube["Order_Day"].between(start, end), metric].sum()
+
+
+def windows(series):
+    """Date windows around the series edges: full, single days, clipped and fully outside."""
+    first, last, day = series["start"], series["end"], pd.Timedelta(days=1)
+    return [
+        (first, last),
+        (first, first),
+        (last, last),
+        (first + 10 * day, first + 40 * day),
+        (first - 30 * day, first + 5 * day),   # Starts before the series
+        (last - 5 * day, last + 30 * day),     # Ends after it
+        (first - 30 * day, first - day),       # Entirely before
+        (last + day, last + 30 * day),         # Entirely after
+        (first + 5 * day, first + 4 * day),    # Empty (end before start)
+    ]
+
+
+@pytest.mark.parametrize("metric", app.DAILY_SERIES_METRICS)
+def test_window_total_matches_pandas_sum(cube, metric):
+    series = app.build_daily_series(cube)
+    for start, end in windows(series):
+        assert app.window_total(series, metric, start, end) == pytest.approx(pandas_total(cube, metric, start, end))
+
+
+def test_new_customers_window(cube, customers):
+    series = app.build_daily_series(cube, customers)
+    first_days = customers["first_order"].dt.normalize()
+    for start, end in windows(series):
+        assert app.window_total(series, "new_customers", start, end) == first_days.between(start, end).sum()
+
+
+def test_bounded_series_covers_the_full_dates(cube):
+    full = app.build_daily_series(cube)
+    lahore = cube[cube["city"] == "Lahore"]
+    bounded = app.build_daily_series(lahore, bounds=(full["start"], full["end"]))
+    assert (bounded["start"], bounded["days"]) == (full["start"], full["days"])
+    for start, end in windows(full):
+        assert app.window_total(bounded, "sales", start, end) == pytest.approx(pandas_total(lahore, "sales", start, end))
+
+
+@pytest.mark.parametrize("comparison", list(app.KPI_COMPARISONS))
+def test_kpi_deltas_match_pandas_windows(cube, comparison):
+    series = app.build_daily_series(cube)
+    date_range = (pd.Timestamp("2025-06-01"), pd.Timestamp("2025-07-15"))
+    deltas = app.kpi_deltas(series, comparison, date_range)
+
+    (start, end), (prior_start, prior_end) = deltas["window"], deltas["prior_window"]
+    assert (start, end) == date_range
+    unit = app.KPI_COMPARISONS[comparison][0]
+    assert (prior_start, prior_end) == (start - pd.DateOffset(**{unit: 1}), end - pd.DateOffset(**{unit: 1}))
+    for metric, key in [("sales", "total_revenue"), ("orders", "total_orders")]:
+        current, prior = pandas_total(cube, metric, start, end), pandas_total(cube, metric, prior_start, prior_end)
+        assert deltas["deltas"][key] == pytest.approx((current - prior) / prior)
+
+
+def test_kpi_deltas_without_a_covered_prior_window(cube):
+    series = app.build_daily_series(cube)
+    date_range = (series["start"], series["start"] + pd.Timedelta(days=20))
+    deltas = app.kpi_deltas(series, "MoM", date_range)
+    assert set(deltas["deltas"].values()) == {None}
+
+
+def test_trailing_window_ends_on_the_last_day(cube):
+    series = app.build_daily_series(cube)
+    deltas = app.kpi_deltas(series, "WoW")
+    assert deltas["window"] == (series["end"] - pd.Timedelta(days=6), series["end"])
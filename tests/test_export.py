@@ -0,0 +1,62 @@
+"""Export encodings read back into the frame they were written from."""
+import gzip
+import io
+
+import pandas as pd
+import pytest
+
+from conftest import app
+
+CHUNK_ROWS = 1_000  # Several chunks (and Parquet row groups) for the bundled export
+
+
+def read_back(payload, fmt):
+    data = payload.read()
+    if fmt == "CSV (gzip)":
+        data = gzip.decompress(data)
+    if fmt == "Parquet":
+        return pd.read_parquet(io.BytesIO(data))
+    return pd.read_csv(io.BytesIO(data), parse_dates=[*app.DATE_COLUMNS, "Order_Day"])
+
+
+def export_formats():
+    return [fmt for fmt in app.EXPORT_FORMATS if fmt != "Parquet" or app.load_parquet() is not None]
+
+
+def as_written(frame):
+    """The frame as an export holds it: 'C5663' IDs and plain text in place of categoricals."""
+    view = app._export_view(frame)
+    return view.astype({col: str for col in view.columns if isinstance(view[col].dtype, pd.CategoricalDtype)})
+
+
+@pytest.mark.parametrize("fmt", export_formats())
+def test_export_round_trip(orders, fmt):
+    payload = app.export_payload(lambda: app.frame_chunks(orders, chunk_rows=CHUNK_ROWS), fmt)
+    back = read_back(payload, fmt)
+    pd.testing.assert_frame_equal(back.astype({col: str for col in back.select_dtypes("category")}),
+                                  as_written(orders), check_dtype=False)
+
+
+@pytest.mark.parametrize("fmt", export_formats())
+def test_filtered_export_round_trip(orders, fmt):
+    positions = app.filter_positions(app.build_filter_index(orders, "order_date"), {"city": ["Lahore"]})
+    payload = app.export_payload(lambda: app.frame_chunks(orders, positions, chunk_rows=CHUNK_ROWS), fmt)
+    back = read_back(payload, fmt)
+    expected = as_written(orders.take(positions)).reset_index(drop=True)
+    pd.testing.assert_frame_equal(back.astype({col: str for col in back.select_dtypes("category")}),
+                                  expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("fmt", export_formats())
+def test_empty_export_keeps_the_columns(orders, fmt):
+    back = read_back(app.export_payload(lambda: app.frame_chunks(orders.iloc[:0]), fmt), fmt)
+    assert back.empty
+    assert back.columns.tolist() == orders.columns.tolist()
+
+
+def test_parquet_writes_a_row_group_per_chunk(orders):
+    parquet = app.load_parquet()
+    if parquet is None:
+        pytest.skip("pyarrow is not installed")
+    payload = app.export_payload(lambda: app.frame_chunks(orders, chunk_rows=CHUNK_ROWS), "Parquet")
+    assert parquet.ParquetFile(payload).num_row_groups == -(-len(orders) // CHUNK_ROWS)
@@ -0,0 +1,55 @@
+"""filter_positions against plain pandas boolean filtering."""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import app
+
+
+def boolean_mask(frame, filters, date_col):
+    """The rows `filters` select, as a pandas boolean mask (date range inclusive of both days)."""
+    mask = pd.Series(True, index=frame.index)
+    date_range = filters.get("date_range")
+    if date_range:
+        start, end = (pd.Timestamp(d) for d in date_range)
+        mask &= frame[date_col].dt.normalize().between(start, end)
+    for col in app.FILTER_DIMENSIONS:
+        if filters.get(col):
+            mask &= frame[col].isin(filters[col])
+    return mask.to_numpy()
+
+
+FILTERS = [
+    {"date_range": (date(2024, 1, 1), date(2024, 3, 31))},
+    {"date_range": (date(2023, 8, 23), date(2023, 8, 23))},  # A single day: both edges inclusive
+    {"city": ["Lahore"]},
+    {"city": ["Lahore", "Karachi"], "payment_method": ["Card"]},
+    {"date_range": (date(2024, 6, 1), date(2024, 12, 31)), "restaurant_name": ["KFC", "Subway"],
+     "category": ["Dessert"]},
+    {"city": ["Nowhere"]},  # A value the index has never seen
+    {"date_range": (date(2030, 1, 1), date(2030, 1, 31))},  # Past the last order
+    {"city": ["Lahore"], "date_range": (date(2030, 1, 1), date(2030, 1, 31))},
+]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_filter_positions_match_boolean_filtering(orders, filters):
+    index = app.build_filter_index(orders, "order_date")
+    positions = app.filter_positions(index, filters)
+    np.testing.assert_array_equal(positions, np.flatnonzero(boolean_mask(orders, filters, "order_date")))
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_apply_filters_on_the_cube(orders, filters):
+    cube = app.build_cube(orders)
+    actual = app.apply_filters(cube, app.build_filter_index(cube, "Order_Day"), filters)
+    expected = cube[boolean_mask(cube, filters, "Order_Day")]
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_no_active_filter_selects_everything(orders):
+    index = app.build_filter_index(orders, "order_date")
+    assert app.filter_positions(index, {"date_range": None, "city": []}) is None
+    assert app.apply_filters(orders, index, {}) is orders
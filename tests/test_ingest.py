@@ -0,0 +1,81 @@
+"""clean_orders' narrow dtypes and the incremental append against a full re-ingest."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import app, assert_same_ingest, write_export
+
+
+def set_field(row, header, col, value):
+    """A data line with one field replaced (the bundled export has no quoted fields)."""
+    fields = row.split(",")
+    fields[header.split(",").index(col)] = value
+    return ",".join(fields)
+
+
+def overflow_rows(header, rows):
+    """Values too large for the narrow dtypes of NUMERIC_DTYPES."""
+    rows = list(rows)
+    rows[0] = set_field(rows[0], header, "quantity", "40000")
+    rows[1] = set_field(rows[1], header, "loyalty_points", "3000000000")
+    rows[2] = set_field(rows[2], header, "rating", "300")
+    return rows
+
+
+def leading_zero_rows(header, rows):
+    """IDs that only differ by leading zeros, so they cannot be stored as integers."""
+    rows = list(rows)
+    rows[0] = set_field(rows[0], header, "customer_id", "C012")
+    rows[1] = set_field(rows[1], header, "customer_id", "C12")
+    rows[2] = set_field(rows[2], header, "order_id", "O0")
+    rows[3] = set_field(rows[3], header, "order_id", "O00")
+    return rows
+
+
+def test_clean_orders_downcasts_columns_that_fit(tmp_path, export_lines):
+    header, rows = export_lines
+    frame = app._full_ingest(write_export(tmp_path / "orders.csv", header, rows))["frame"]
+    raw = pd.read_csv(tmp_path / "orders.csv")
+    for col, dtype in app.NUMERIC_DTYPES.items():
+        assert frame[col].dtype == dtype
+        np.testing.assert_array_equal(frame[col].to_numpy(), raw[col].to_numpy())
+    for col in app.ID_COLUMNS:
+        assert pd.api.types.is_integer_dtype(frame[col])
+
+
+def test_clean_orders_keeps_values_that_overflow_the_narrow_dtype(tmp_path, export_lines):
+    header, rows = export_lines
+    frame = app._full_ingest(write_export(tmp_path / "orders.csv", header, overflow_rows(header, rows)))["frame"]
+    assert frame.loc[0, "quantity"] == 40000
+    assert frame.loc[1, "loyalty_points"] == 3_000_000_000
+    assert frame.loc[2, "rating"] == 300
+    assert frame.loc[0, "sales"] == pytest.approx(40000 * float(rows[0].split(",")[11]))
+
+
+def test_ids_with_leading_zeros_stay_distinct(tmp_path, export_lines):
+    header, rows = export_lines
+    state = app._full_ingest(write_export(tmp_path / "orders.csv", header, leading_zero_rows(header, rows)))
+    frame = state["frame"]
+    assert frame.loc[:1, "customer_id"].astype(str).tolist() == ["C012", "C12"]
+    assert frame.loc[2:3, "order_id"].astype(str).tolist() == ["O0", "O00"]
+    assert {"C012", "C12"} <= set(state["customers"]["customer_id"].astype(str))
+    exported = app._export_view(frame.head(4))
+    assert exported["customer_id"].astype(str).tolist()[:2] == ["C012", "C12"]
+
+
+@pytest.mark.parametrize("variant", [None, overflow_rows, leading_zero_rows])
+@pytest.mark.parametrize("from_snapshot", [False, True])
+def test_incremental_append_matches_full_ingest(tmp_path, export_lines, variant, from_snapshot):
+    header, rows = export_lines
+    split = len(rows) * 2 // 3
+    appended = variant(header, rows[split:]) if variant else rows[split:]
+    path = write_export(tmp_path / "orders.csv", header, rows[:split])
+    snapshot_dir = tmp_path / "snapshot"
+
+    app.ingest_source(path, snapshot_dir, retain=not from_snapshot)
+    with open(path, "a") as fh:
+        fh.write("\n".join(appended) + "\n")
+    incremental = app.ingest_source(path, snapshot_dir, retain=False)
+
+    assert incremental["consumed_bytes"] == path.stat().st_size
+    assert_same_ingest(app._full_ingest(path), incremental, exact=False)
@@ -0,0 +1,35 @@
+"""The process-pool ingest must give exactly the single-process result."""
+import pytest
+
+from conftest import app, assert_same_ingest, write_export
+from test_ingest import leading_zero_rows, overflow_rows
+
+
+@pytest.fixture(params=[None, overflow_rows, leading_zero_rows])
+def large_export(request, tmp_path, export_lines):
+    """The bundled export repeated, with a few missing category values to exercise the fill placeholders.
+
+    The overflow and leading-zero variants change rows near the end, so only the last
+    worker's byte range falls back to the wider dtype or to text IDs.
+    """
+    header, rows = export_lines
+    rows = rows * 4
+    rows[7] = rows[7].replace(",Cash,", ",,")
+    rows[12345] = rows[12345].replace(",Lahore,", ",,")
+    if request.param:
+        rows[-10:] = request.param(header, rows[-10:])
+    return write_export(tmp_path / "orders.csv", header, rows)
+
+
+def full_ingest(monkeypatch, path, workers):
+    monkeypatch.setattr(app, "PARALLEL_WORKERS", workers)
+    monkeypatch.setattr(app, "PARALLEL_MIN_BYTES", 0)
+    return app._full_ingest(path)
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_parallel_full_ingest_matches_single_process(monkeypatch, large_export, workers):
+    expected = full_ingest(monkeypatch, large_export, 1)
+    actual = full_ingest(monkeypatch, large_export, workers)
+    assert_same_ingest(expected, actual)
+    assert actual["consumed_bytes"] == expected["consumed_bytes"]
@@ -0,0 +1,67 @@
+"""Delivery/rating bitsets against boolean masks and a pandas groupby baseline."""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import app
+
+
+@pytest.mark.parametrize("rows", [0, 1, 63, 64, 65, 1_000])
+def test_bitset_popcount_matches_mask_sum(rows):
+    rng = np.random.default_rng(rows)
+    mask, other = rng.random(rows) < 0.3, rng.random(rows) < 0.6
+    bits = app.pack_bits(mask)
+    assert app.popcount(bits) == mask.sum()
+    assert app.popcount(bits & app.pack_bits(other)) == (mask & other).sum()
+    np.testing.assert_array_equal(app.pack_positions(np.flatnonzero(mask), rows), bits)
+
+
+def quality_baseline(frame, segment):
+    """delivery_overview_aggregates' segment table computed with a plain pandas groupby."""
+    groups = frame.groupby(segment, observed=True)
+    shares = pd.crosstab(frame[segment], frame[app.DELIVERY_STATUS_COL], normalize="index") * 100
+    table = pd.DataFrame({"Orders": groups.size()})
+    for status in shares.columns:
+        table[f"{status} %"] = shares[status]
+    table["Avg Rating"] = groups[app.RATING_COL].mean()
+    return table.rename_axis("Segment").reset_index().assign(Segment=lambda t: t["Segment"].astype(str))
+
+
+def sorted_segments(table):
+    return table.sort_values("Segment", ignore_index=True)
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"city": ["Lahore", "Karachi"]},
+    {"date_range": (date(2024, 1, 1), date(2024, 6, 30)), "payment_method": ["Cash"]},
+])
+@pytest.mark.parametrize("segment", ["city", "restaurant_name", "payment_method"])
+def test_delivery_aggregates_match_groupby(orders, filters, segment):
+    index = app.build_quality_index(orders, app.build_filter_index(orders, "order_date"))
+    aggregates = app.delivery_overview_aggregates(index, filters, segment)
+    selected = app.apply_filters(orders, index["filter_index"], filters)
+
+    expected = quality_baseline(selected, segment)
+    pd.testing.assert_frame_equal(sorted_segments(aggregates["segments"]), sorted_segments(expected),
+                                  check_dtype=False)
+    ratings = selected[app.RATING_COL].value_counts().reindex(app.RATING_VALUES, fill_value=0)
+    assert aggregates["rating_counts"]["Orders"].tolist() == ratings.tolist()
+    assert aggregates["kpis"]["Orders"] == len(selected)
+
+
+def test_segments_past_the_top_fold_into_other(orders, monkeypatch):
+    monkeypatch.setattr(app, "QUALITY_TOP_SEGMENTS", 2)
+    index = app.build_quality_index(orders, app.build_filter_index(orders, "order_date"))
+    segments = app.delivery_overview_aggregates(index, {}, "city")["segments"]
+
+    counts = orders["city"].value_counts()
+    assert segments["Segment"].tolist()[-1] == app.OTHER_LABEL
+    assert segments["Orders"].tolist() == [*counts.iloc[:2], counts.iloc[2:].sum()]
+    others = orders[~orders["city"].isin(counts.index[:2])]
+    other = segments.iloc[-1]
+    assert other["Avg Rating"] == pytest.approx(others[app.RATING_COL].mean())
+    for status, share in others[app.DELIVERY_STATUS_COL].value_counts(normalize=True).items():
+        assert other[f"{status} %"] == pytest.approx(share * 100)
@@ -0,0 +1,65 @@
+"""HyperLogLog distinct counts: estimate error bounds and merging against exact nunique."""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import app
+
+# Deterministic hashes make these fixed draws; four standard deviations leaves a wide margin
+TOLERANCE_SIGMAS = 4
+
+
+@pytest.mark.parametrize("precision", [10, 12])
+@pytest.mark.parametrize("distinct", [10, 1_000, 50_000, 500_000])
+def test_estimate_within_error_bound(precision, distinct):
+    values = np.arange(distinct, dtype=np.int64).repeat(2)  # Duplicates must not count twice
+    index, rank = app._hll_index_and_rank(values, precision)
+    registers = app._hll_fill(np.zeros(len(values)), 1, index, rank, precision)[0]
+    error = abs(float(app.hll_estimate(registers)) - distinct) / distinct
+    assert error <= TOLERANCE_SIGMAS * app.sketch_error_bound(precision)
+
+
+FILTERS = [
+    {},
+    {"date_range": (date(2024, 1, 1), date(2024, 3, 31))},
+    {"city": ["Lahore", "Karachi"]},
+    {"payment_method": ["Card"], "date_range": (date(2023, 9, 1), date(2024, 8, 31))},
+]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("metric", list(app.SKETCH_METRICS))
+def test_sketch_distinct_within_error_bound(orders, filters, metric):
+    sketches = app.build_sketches(orders)
+    selected = app.apply_filters(orders, app.build_filter_index(orders, "order_date"), filters)
+    exact = selected[app.SKETCH_METRICS[metric]].nunique()
+    estimate = app.sketch_distinct(sketches, metric, filters)
+    assert abs(estimate - exact) <= TOLERANCE_SIGMAS * app.sketch_error_bound() * exact
+
+
+def test_merged_sketches_equal_sketches_of_the_union(orders):
+    cutoff = pd.Timestamp("2024-03-01")
+    early = orders[orders["Order_Day"] < cutoff]
+    # The later half only sees some cities, so merging has to align the value axes
+    late = orders[(orders["Order_Day"] >= cutoff) & orders["city"].isin(["Multan", "Lahore"])]
+    whole = app.build_sketches(pd.concat([early, late]))
+    merged = app.merge_sketches(app.build_sketches(early), app.build_sketches(late))
+
+    np.testing.assert_array_equal(merged["days"], whole["days"])
+    for metric in app.SKETCH_METRICS:
+        np.testing.assert_array_equal(merged[metric]["all"], whole[metric]["all"])
+        for filters in FILTERS:
+            assert app.sketch_distinct(merged, metric, filters) == app.sketch_distinct(whole, metric, filters)
+        pd.testing.assert_series_equal(
+            app.sketch_distinct_by(merged, metric, "city", {}).sort_index(),
+            app.sketch_distinct_by(whole, metric, "city", {}).sort_index(),
+            check_index_type=False,
+        )
+
+
+def test_merge_with_nothing_is_the_identity(orders):
+    sketches = app.build_sketches(orders)
+    assert app.merge_sketches(None, sketches) is sketches
+    assert app.merge_sketches(sketches, None) is sketches
@@ -0,0 +1,28 @@
+"""The chunked streaming path against aggregates built from the whole frame."""
+import pytest
+
+from conftest import REPO_DIR, app, assert_same_aggregates
+
+
+@pytest.fixture(scope="module")
+def reference():
+    frame = app._full_ingest(REPO_DIR / "dataset")["frame"]
+    return frame, app.build_aggregates(frame)
+
+
+# One chunk, a few chunks, and enough chunks (at fan-in 8) for a three-level merge tree
+@pytest.mark.parametrize("chunksize", [10_000, 1_000, 97])
+def test_stream_kpis_matches_build_aggregates(reference, chunksize):
+    frame, expected = reference
+    streamed = app.stream_kpis(REPO_DIR / "dataset", chunksize)
+    assert streamed["rows"] == len(frame)
+    assert_same_aggregates(expected, streamed, exact=False)
+    assert streamed["total_revenue"] == pytest.approx(frame["sales"].sum())
+    assert streamed["total_orders"] == frame["order_id"].nunique()
+    assert streamed["total_customers"] == frame["customer_id"].nunique()
+
+
+@pytest.mark.parametrize("parts", [0, 1, 7, 8, 9, 64, 100])
+def test_merge_tree_keeps_stream_order(parts):
+    merged = app.merge_tree(([i] for i in range(parts)), lambda *lists: [x for part in lists for x in part], fanin=8)
+    assert merged == (list(range(parts)) if parts else None)